@@ -2,9 +2,11 @@ import os
 
 from dotenv import load_dotenv
 from flask import Flask
-from sqlalchemy import inspect
+from sqlalchemy import event, inspect, text
 
-from extensions import db
+from extensions import db, set_sqlite_pragmas
+from models.file import DEFAULT_FILE_HASH_METHOD
+from models.note import init_notes_fts
 from routes.about import about_bp
 from routes.admin import admin_bp, init_admin_db
 from routes.apps import apps_bp
@@ -24,12 +26,18 @@ app.secret_key = os.environ.get("SECRET_KEY", "fallback_secret_key_dev")
 
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///boko_hacks.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["FILE_HASH_METHOD"] = DEFAULT_FILE_HASH_METHOD
+# Only enable behind a front-end server (nginx/Apache) that handles X-Sendfile
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE", "").lower() == "true"
 
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 db.init_app(app)
 
+with app.app_context():
+    event.listen(db.engine, "connect", set_sqlite_pragmas)
+
 # Register Blueprints
 app.register_blueprint(home_bp)
 app.register_blueprint(hub_bp)
@@ -44,6 +52,21 @@ app.register_blueprint(news_bp)
 app.register_blueprint(retirement_bp)
 
 
+def add_missing_columns(table, inspector):
+    """Add model columns that an existing table predates (all are nullable)"""
+    existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+                print(f"Added column {table.name}.{column.name}")
+
+
 def setup_database():
     """Setup database and print debug info"""
     with app.app_context():
@@ -61,6 +84,15 @@ def setup_database():
             db.create_all()
             print("Updated schema with any new tables")
 
+            # create_all skips new columns and indexes on tables that already exist
+            for table in db.metadata.sorted_tables:
+                if table.name in existing_tables:
+                    add_missing_columns(table, inspector)
+                for index in table.indexes:
+                    index.create(db.engine, checkfirst=True)
+
+        init_notes_fts()
+
         for table in ["users", "notes", "admin_credentials", "files"]:
             if table in inspector.get_table_names():
                 print(f"\n{table.capitalize()} table columns:")
@@ -1,11 +1,33 @@
-from werkzeug.security import check_password_hash, generate_password_hash
-
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
 from extensions import db
 
+# File passwords guard downloads, not accounts, so they use a cheaper KDF than logins.
+DEFAULT_FILE_HASH_METHOD = "pbkdf2:sha256:120000"
+
+# (password hash, sha256 of candidate) pairs that already verified successfully
+_VERIFIED_CACHE_SIZE = 256
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
+
+
 class File(db.Model):
     __tablename__ = "files"
+    __table_args__ = (
+        db.Index(
+            "ix_files_user_uploaded_id",
+            "user_id",
+            db.desc("uploaded_at"),
+            db.desc("id"),
+        ),
+        db.Index("ix_files_user_hash", "user_id", "content_hash", unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
@@ -14,24 +36,43 @@ class File(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     public = db.Column(db.Boolean, default=False)
     password = db.Column(db.String(100), nullable=True)
+    content_hash = db.Column(db.String(32), nullable=True)
+    has_password = db.column_property(password.isnot(None))
 
     def set_password(self, password):
         """Hashes password and stores it."""
-        self.password = generate_password_hash(password)
+        method = current_app.config.get("FILE_HASH_METHOD", DEFAULT_FILE_HASH_METHOD)
+        self.password = generate_password_hash(password, method=method)
 
     def check_password(self, password) -> bool:
-        """Compares hashed password to user-provided password."""
-        return check_password_hash(self.password, password)
+        """Compares hashed password to user-provided password.
+
+        Successful verifications are remembered so repeat downloads skip the KDF.
+        """
+        key = (self.password, hashlib.sha256(password.encode()).digest())
+        with _verified_lock:
+            if key in _verified:
+                _verified.move_to_end(key)
+                return True
+
+        if not check_password_hash(self.password, password):
+            return False
+
+        with _verified_lock:
+            _verified[key] = True
+            if len(_verified) > _VERIFIED_CACHE_SIZE:
+                _verified.popitem(last=False)
+        return True
 
     def to_dict(self):
         return {
             "id": self.id,
             "filename": self.filename,
             "file_path": self.file_path,
-            "uploaded_at": self.uploaded_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "uploaded_at": self.uploaded_at.isoformat(sep=" ", timespec="seconds"),
             "user_id": self.user_id,
             "public": self.public,
-            "password": self.password,
+            "has_password": self.has_password,
         }
 
     def __repr__(self):
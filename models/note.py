@@ -1,10 +1,34 @@
 from datetime import datetime
 
+from sqlalchemy import text
+
 from extensions import db
 
+# SQLite FTS5 index over notes, kept in sync with the notes table by triggers
+NOTES_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+    "title, content, content='notes', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO notes_fts(rowid, title, content) "
+    "VALUES (new.id, new.title, new.content); END",
+)
+
 
 class Note(db.Model):
     __tablename__ = "notes"
+    __table_args__ = (
+        db.Index(
+            "ix_notes_user_created_id", "user_id", db.desc("created_at"), db.desc("id")
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -17,9 +41,21 @@ class Note(db.Model):
             "id": self.id,
             "title": self.title,
             "content": self.content,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.created_at.isoformat(sep=" ", timespec="seconds"),
             "user_id": self.user_id,
         }
 
     def __repr__(self):
         return f"<Note {self.title}>"
+
+
+def init_notes_fts():
+    """Create the notes full-text index, backfilling it on first creation."""
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'")
+        ).first()
+        for statement in NOTES_FTS_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
@@ -1,107 +1,207 @@
+import hashlib
+import logging
 import os
+import queue
+import tempfile
+import threading
 
 from flask import (
     Blueprint,
+    current_app,
     jsonify,
     render_template,
     request,
-    send_from_directory,
+    send_file,
     session,
 )
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import defer, load_only
 from werkzeug.utils import secure_filename
 
 from extensions import db
 from models.file import File
-from models.user import User
+from utils.auth import get_current_user
+from utils.pagination import paginate
 
 ALLOWED_MIMETYPES = {"application/pdf", "image/png", "image/jpeg", "image/gif"}
 UPLOAD_FOLDER = "uploads"
+MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_ABS = os.path.abspath(UPLOAD_FOLDER)
 
 files_bp = Blueprint("files", __name__, url_prefix="/apps/files")
 
+# Filesystem unlinks run off the request thread; BLOB_LOCK serializes them
+# with uploads that may link the same content-addressed blob
+DELETE_QUEUE = queue.Queue()
+BLOB_LOCK = threading.Lock()
+
 
 def allowed_mimetype(mimetype):
     return mimetype in ALLOWED_MIMETYPES
 
 
+def _delete_worker():
+    """Unlink blobs queued by delete_file once no row references them."""
+    while True:
+        app, file_path = DELETE_QUEUE.get()
+        try:
+            with app.app_context(), BLOB_LOCK:
+                disk_path = upload_path(file_path)
+                # Other uploads of the same content share this path on disk
+                if (
+                    File.query.options(load_only(File.id))
+                    .filter_by(file_path=file_path)
+                    .first()
+                ):
+                    app.logger.debug("File still referenced: %s", file_path)
+                elif os.path.exists(disk_path):
+                    os.remove(disk_path)
+                    app.logger.debug("File deleted from filesystem: %s", disk_path)
+                else:
+                    app.logger.warning("File not found on filesystem: %s", disk_path)
+        except Exception as e:
+            app.logger.exception("Error deleting file from filesystem: %s", e)
+        finally:
+            DELETE_QUEUE.task_done()
+
+
+def duplicate_upload_response():
+    return jsonify({"success": False, "error": "You already uploaded this file"}), 409
+
+
+def upload_path(file_path):
+    """Absolute on-disk path for a stored file_path.
+
+    Older rows hold the path relative to the working directory, including the
+    upload folder; newer ones are relative to the upload folder itself.
+    """
+    if file_path.startswith(UPLOAD_FOLDER + os.sep):
+        return os.path.abspath(file_path)
+    return os.path.join(UPLOAD_ABS, file_path)
+
+
+threading.Thread(target=_delete_worker, name="file-deleter", daemon=True).start()
+
+
 @files_bp.route("/")
 def files():
-    """Render files page with all files uploaded by the current user"""
-    print("=== FILES LISTING ROUTE ACCESSED ===")
+    """Render a page of the files uploaded by the current user, newest first"""
+    current_app.logger.debug("=== FILES LISTING ROUTE ACCESSED ===")
     if "user" not in session:
-        print("User not logged in")
+        current_app.logger.debug("User not logged in")
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
-        print(f"User {session['user']} not found in database")
+        current_app.logger.debug("User %s not found in database", session["user"])
         return jsonify({"success": False, "error": "User not found"}), 404
 
-    print(f"Loading files for user: {current_user.username} (ID: {current_user.id})")
-
-    all_files = (
-        File.query.filter_by(user_id=current_user.id)
-        .order_by(File.uploaded_at.desc())
-        .all()
+    current_app.logger.debug(
+        "Loading files for user: %s (ID: %s)", current_user.username, current_user.id
     )
-    print(f"Found {len(all_files)} files")
 
-    for file in all_files:
-        print(
-            f"  - ID: {file.id}, Filename: {file.filename}, Uploaded: {file.uploaded_at}"
+    # Only the columns the listing renders, walked in ix_files_user_uploaded_id order
+    query = File.query.options(
+        load_only(
+            File.id, File.filename, File.uploaded_at, File.public, File.has_password
         )
+    ).filter_by(user_id=current_user.id)
+    try:
+        all_files, next_cursor = paginate(query, File.uploaded_at, File.id)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid cursor"}), 400
+
+    if current_app.logger.isEnabledFor(logging.DEBUG):
+        current_app.logger.debug("Found %d files", len(all_files))
+        for file in all_files:
+            current_app.logger.debug(
+                "  - ID: %s, Filename: %s, Uploaded: %s",
+                file.id,
+                file.filename,
+                file.uploaded_at,
+            )
 
     return render_template(
-        "files.html", files=all_files, current_user_id=current_user.id
+        "files.html",
+        files=all_files,
+        current_user_id=current_user.id,
+        next_cursor=next_cursor,
     )
 
 
 @files_bp.route("/upload", methods=["POST"])
 def upload_file():
     """Handle file upload with fixed upload folder and allowed file types"""
-    print("\n=== FILE UPLOAD ATTEMPT ===")
-    print(f"Request method: {request.method}")
-    print(f"Form data: {request.form}")
-    print(f"Files: {request.files}")
+    current_app.logger.debug("=== FILE UPLOAD ATTEMPT ===")
+    current_app.logger.debug("Request method: %s", request.method)
+    current_app.logger.debug("Form data: %s", request.form)
+    current_app.logger.debug("Files: %s", request.files)
 
     if "user" not in session:
-        print("User not logged in")
+        current_app.logger.debug("User not logged in")
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
-        print(f"User {session['user']} not found in database")
+        current_app.logger.debug("User %s not found in database", session["user"])
         return jsonify({"success": False, "error": "User not found"}), 404
 
     file = request.files.get("file")
-    print(f"Received file: {file}")
+    current_app.logger.debug("Received file: %s", file)
 
     if not file:
-        print("No file part in request")
+        current_app.logger.debug("No file part in request")
         return jsonify({"success": False, "error": "No file part"}), 400
 
     if file:
         if not allowed_mimetype(file.mimetype):
-            print(f"File type not allowed: {file.mimetype}")
+            current_app.logger.debug("File type not allowed: %s", file.mimetype)
             return jsonify({"success": False, "error": "File type not allowed"}), 400
 
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_length = file.tell()
-        file.seek(0, os.SEEK_SET)
-        MAX_FILE_SIZE = 5 * 1024 * 1024  # 5 MB
-        if file_length > MAX_FILE_SIZE:
-            print(f"File size exceeds limit: {file_length} bytes")
-            return jsonify({"success": False, "error": "File size exceeds limit"}), 400
-
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        print(f"File path: {file_path}")
 
+        tmp_path = None
         try:
-            file.save(file_path)
-            print(f"File saved successfully at {file_path}")
+            # Stream to disk once, hashing and enforcing the size limit as bytes arrive
+            digest = hashlib.blake2b(digest_size=16)
+            written = 0
+            with tempfile.NamedTemporaryFile(
+                dir=UPLOAD_ABS, suffix=".part", delete=False
+            ) as dst:
+                tmp_path = dst.name
+                while True:
+                    chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > MAX_FILE_SIZE:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+
+            if written > MAX_FILE_SIZE:
+                current_app.logger.debug(
+                    "File size exceeds limit of %d bytes", MAX_FILE_SIZE
+                )
+                return jsonify(
+                    {"success": False, "error": "File size exceeds limit"}
+                ), 400
+
+            content_hash = digest.hexdigest()
+            if (
+                File.query.options(load_only(File.id))
+                .filter_by(user_id=current_user.id, content_hash=content_hash)
+                .first()
+            ):
+                current_app.logger.debug("Duplicate upload: %s", content_hash)
+                return duplicate_upload_response()
+
+            # Content-addressed: identical uploads share one copy on disk.
+            # Rows store the path relative to the upload folder.
+            file_path = os.path.join(content_hash[:2], content_hash)
+            disk_path = os.path.join(UPLOAD_ABS, file_path)
 
             is_public = request.form.get("public", "off").lower() == "on"
             new_file = File(
@@ -109,6 +209,7 @@ def upload_file():
                 file_path=file_path,
                 user_id=current_user.id,
                 public=is_public,
+                content_hash=content_hash,
             )
 
             # Set password if provided
@@ -116,9 +217,28 @@ def upload_file():
             if file_password:
                 new_file.set_password(file_password)
 
-            db.session.add(new_file)
-            db.session.commit()
-            print(f"File record saved to database with ID: {new_file.id}")
+            # Link and commit together so the deleter never removes a blob that
+            # a new row is about to reference
+            with BLOB_LOCK:
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                try:
+                    os.link(tmp_path, disk_path)
+                    linked = True
+                except FileExistsError:
+                    linked = False
+                try:
+                    db.session.add(new_file)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # No row references a blob this upload just created
+                    if linked:
+                        os.remove(disk_path)
+                    raise
+            current_app.logger.debug("File saved successfully at %s", disk_path)
+            current_app.logger.debug(
+                "File record saved to database with ID: %s", new_file.id
+            )
 
             return jsonify(
                 {
@@ -127,90 +247,96 @@ def upload_file():
                     "file": new_file.to_dict(),
                 }
             )
+        except IntegrityError:
+            # A concurrent upload of the same content won the ix_files_user_hash race
+            current_app.logger.debug("Duplicate upload: %s", content_hash)
+            return duplicate_upload_response()
         except Exception as e:
-            print(f"Error saving file: {str(e)}")
-            import traceback
-
-            traceback.print_exc()
+            db.session.rollback()
+            current_app.logger.exception("Error saving file: %s", e)
             return jsonify({"success": False, "error": str(e)}), 500
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
     else:
-        print("File type not allowed or no file uploaded")
+        current_app.logger.debug("File type not allowed or no file uploaded")
         return jsonify({"success": False, "error": "File type not allowed"}), 400
 
 
 @files_bp.route("/delete/<int:file_id>", methods=["DELETE"])
 def delete_file(file_id):
     """Delete a file"""
-    print(f"\n=== FILE DELETE ATTEMPT: ID {file_id} ===")
+    current_app.logger.debug("=== FILE DELETE ATTEMPT: ID %s ===", file_id)
 
     if "user" not in session:
-        print("User not logged in")
+        current_app.logger.debug("User not logged in")
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
-        print(f"User {session['user']} not found in database")
+        current_app.logger.debug("User %s not found in database", session["user"])
         return jsonify({"success": False, "error": "User not found"}), 404
 
     try:
-        file = File.query.get_or_404(file_id)
-        print(f"Found file {file_id}: {file.filename}")
-
-        if file.user_id != current_user.id:
-            print(
-                f"Access denied: File {file_id} belongs to user {file.user_id}, not {current_user.id}"
+        # Ownership is part of the lookup, so other users' files are simply not found
+        file = (
+            File.query.options(defer(File.password))
+            .filter_by(id=file_id, user_id=current_user.id)
+            .first()
+        )
+        if not file:
+            current_app.logger.debug(
+                "File %s not found for user %s", file_id, current_user.id
             )
-            return jsonify({"success": False, "error": "Access denied"}), 403
+            return jsonify({"success": False, "error": "File not found"}), 404
+        current_app.logger.debug("Found file %s: %s", file_id, file.filename)
 
         file_path = file.file_path
 
         db.session.delete(file)
         db.session.commit()
-        print("File record deleted from database")
+        current_app.logger.debug("File record deleted from database")
 
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"File deleted from filesystem: {file_path}")
-        else:
-            print(f"Warning: File not found on filesystem: {file_path}")
+        # The row is gone, so the blob can be unlinked after the response
+        DELETE_QUEUE.put((current_app._get_current_object(), file_path))
 
         return jsonify({"success": True, "message": "File deleted successfully"})
     except Exception as e:
-        print(f"Error deleting file: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        current_app.logger.exception("Error deleting file: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @files_bp.route("/download/<int:file_id>", methods=["GET", "POST"])
 def download_file(file_id):
-    """Download a file using send_from_directory for maximum compatibility"""
-    print(f"\n=== FILE DOWNLOAD ATTEMPT: ID {file_id} ===")
+    """Download a file, honoring conditional and Range requests"""
+    current_app.logger.debug("=== FILE DOWNLOAD ATTEMPT: ID %s ===", file_id)
 
     if "user" not in session:
-        print("User not logged in")
+        current_app.logger.debug("User not logged in")
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
-        print(f"User {session['user']} not found in database")
+        current_app.logger.debug("User %s not found in database", session["user"])
         return jsonify({"success": False, "error": "User not found"}), 404
 
     try:
-        file = File.query.get_or_404(file_id)
-        print(f"Found file {file_id}: {file.filename}")
-
-        if not file.public and file.user_id != current_user.id:
-            print(
-                f"Access denied: File {file_id} belongs to user {file.user_id}, not {current_user.id}"
+        # Ownership is part of the lookup, so other users' private files are not found
+        file = File.query.filter(
+            File.id == file_id,
+            db.or_(File.user_id == current_user.id, File.public.is_(True)),
+        ).first()
+        if not file:
+            current_app.logger.debug(
+                "File %s not found for user %s", file_id, current_user.id
             )
-            return jsonify({"success": False, "error": "Access denied"}), 403
+            return jsonify({"success": False, "error": "File not found"}), 404
+        current_app.logger.debug("Found file %s: %s", file_id, file.filename)
 
         # Check if the file is password protected
         if file.password:
             if request.method == "GET":
-                print("Password required, showing password form")
+                current_app.logger.debug("Password required, showing password form")
                 # Return a form to enter the password instead of an error
                 return render_template(
                     "file_password.html",
@@ -227,20 +353,22 @@ def download_file(file_id):
                         error="Incorrect password"
                     ), 403
 
-        # Get the directory and filename
-        directory = os.path.dirname(file.file_path)
-        filename = os.path.basename(file.file_path)
-
-        if os.path.exists(file.file_path):
-            print(f"Sending file: {file.file_path}")
-
-            return send_from_directory(directory, filename, as_attachment=True)
+        disk_path = upload_path(file.file_path)
+        if os.path.exists(disk_path):
+            current_app.logger.debug("Sending file: %s", disk_path)
+
+            # Stored ETag/upload time let conditional and Range requests skip a stat
+            return send_file(
+                disk_path,
+                as_attachment=True,
+                download_name=file.filename,
+                conditional=True,
+                etag=file.content_hash or True,
+                last_modified=file.uploaded_at,
+            )
         else:
-            print(f"Error: File not found on filesystem: {file.file_path}")
+            current_app.logger.warning("File not found on filesystem: %s", disk_path)
             return jsonify({"success": False, "error": "File not found on server"}), 404
     except Exception as e:
-        print(f"Error sending file: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        current_app.logger.exception("Error sending file: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
@@ -26,6 +26,7 @@ def login():
         user = User.query.filter_by(username=username).first()
         if user and user.check_password(password):
             session["user"] = user.username
+            session["user_id"] = user.id
             flash("Login successful!", "success")
             return redirect(url_for("hub.hub"))
         else:
@@ -39,6 +40,7 @@ def login():
 @login_bp.route("/logout")
 def logout():
     session.pop("user", None)
+    session.pop("user_id", None)
     session.pop("_flashes", None)
     flash("You have been logged out.", "info")
     return redirect(url_for("login.login"))
@@ -1,23 +1,68 @@
+import logging
+import threading
 from datetime import datetime
 
-import bleach  # Add this import for XSS protection
-from flask import Blueprint, jsonify, render_template, request, session
-from sqlalchemy import text
+from bleach.sanitizer import Cleaner  # Add this import for XSS protection
+from flask import (
+    Blueprint,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    session,
+)
+from sqlalchemy import insert, text
 
 from extensions import db
 from models.note import Note
 from models.user import User
+from utils.auth import current_user_is_admin, get_current_user
+from utils.pagination import paginate
 
 notes_bp = Blueprint("notes", __name__, url_prefix="/apps/notes")
 
+SEARCH_LIMIT = 500
+MAX_TITLE_LENGTH = 100
+MAX_CONTENT_LENGTH = 5000
+MAX_BATCH_SIZE = 100
+
+# bleach Cleaners are reusable but not thread-safe, so keep one per thread
+_cleaners = threading.local()
+
+
+def clean_html(value):
+    """Sanitize user input with bleach's default allow-list, like bleach.clean."""
+    cleaner = getattr(_cleaners, "cleaner", None)
+    if cleaner is None:
+        cleaner = _cleaners.cleaner = Cleaner()
+    return cleaner.clean(value)
+
+
+def fts_match_expression(query):
+    """Turn free-text search input into an FTS5 prefix query on each word.
+
+    Every word is quoted so user input can never be parsed as FTS5 syntax.
+    """
+    terms = ['"' + word.replace('"', '""') + '"*' for word in query.split()]
+    return " ".join(terms)
+
+
+def length_error(title, content):
+    """Return an error message if title or content is too long, else None."""
+    if len(title) > MAX_TITLE_LENGTH:
+        return f"Title exceeds maximum length of {MAX_TITLE_LENGTH} characters"
+    if len(content) > MAX_CONTENT_LENGTH:
+        return f"Content exceeds maximum length of {MAX_CONTENT_LENGTH} characters"
+    return None
+
 
 @notes_bp.route("/")
 def notes():
-    """Render notes page with all notes"""
+    """Render a page of notes, newest first"""
     if "user" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
         return jsonify({"success": False, "error": "User not found"}), 404
 
@@ -26,18 +71,27 @@ def notes():
     try:
         user_id = int(user_id)
         # Fix: Add access control - only allow viewing own notes or admin access
-        if user_id != current_user.id and not current_user.is_admin():
+        if user_id != current_user.id and not current_user_is_admin():
             return jsonify({"success": False, "error": "Unauthorized access"}), 403
     except (TypeError, ValueError):
         user_id = current_user.id
 
-    all_notes = (
-        Note.query.filter_by(user_id=user_id).order_by(Note.created_at.desc()).all()
+    try:
+        all_notes, next_cursor = paginate(
+            Note.query.filter_by(user_id=user_id), Note.created_at, Note.id
+        )
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid cursor"}), 400
+
+    current_app.logger.debug(
+        "Loading notes page - Found %d notes for user %s", len(all_notes), user_id
     )
-    print(f"Loading notes page - Found {len(all_notes)} notes for user {user_id}")
 
     return render_template(
-        "notes.html", notes=all_notes, current_user_id=current_user.id
+        "notes.html",
+        notes=all_notes,
+        current_user_id=current_user.id,
+        next_cursor=next_cursor,
     )
 
 
@@ -47,13 +101,20 @@ def create_note():
     if "user" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    # Reject oversized input before paying for the user lookup or sanitizing it
+    raw_title = request.form.get("title", "")
+    raw_content = request.form.get("content", "")
+    error = length_error(raw_title, raw_content)
+    if error:
+        return jsonify({"success": False, "error": error}), 400
+
+    current_user = get_current_user()
     if not current_user:
         return jsonify({"success": False, "error": "User not found"}), 404
 
     # Fix: Sanitize user input to prevent XSS
-    title = bleach.clean(request.form.get("title", ""))
-    content = bleach.clean(request.form.get("content", ""))
+    title = clean_html(raw_title)
+    content = clean_html(raw_content)
 
     if not title or not content:
         return jsonify(
@@ -61,33 +122,14 @@ def create_note():
         ), 400
 
     try:
-        print(f"Creating note - Title: {title}, Content: {content}")
-
-        # Validate title and content length
-        max_title_length = 100
-        max_content_length = 5000
-
-        if len(title) > max_title_length:
-            return (
-                jsonify(
-                    {
-                        "success": False,
-                        "error": f"Title exceeds maximum length of {max_title_length} characters",
-                    }
-                ),
-                400,
-            )
+        current_app.logger.debug(
+            "Creating note - Title: %s, Content: %s", title, content
+        )
 
-        if len(content) > max_content_length:
-            return (
-                jsonify(
-                    {
-                        "success": False,
-                        "error": f"Content exceeds maximum length of {max_content_length} characters",
-                    }
-                ),
-                400,
-            )
+        # Escaping can lengthen the input, so check again after sanitizing
+        error = length_error(title, content)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
 
         note = Note(
             title=title,
@@ -99,23 +141,91 @@ def create_note():
         db.session.add(note)
         db.session.commit()
 
-        print(f"Note created with ID: {note.id}")
+        current_app.logger.debug("Note created with ID: %s", note.id)
 
         return jsonify(
             {
                 "success": True,
                 "message": "Note created successfully",
-                "note": {
-                    "id": note.id,
-                    "title": note.title,
-                    "content": note.content,
-                    "created_at": note.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    "user_id": note.user_id,
-                },
+                "note": note.to_dict(),
+            }
+        )
+    except Exception as e:
+        current_app.logger.error("Error creating note: %s", e)
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@notes_bp.route("/create_many", methods=["POST"])
+def create_many_notes():
+    """Create a batch of notes in a single INSERT and commit"""
+    if "user" not in session:
+        return jsonify({"success": False, "error": "Not logged in"}), 401
+
+    data = request.get_json(silent=True)
+    items = data.get("notes") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "A list of notes is required"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify(
+            {
+                "success": False,
+                "error": f"At most {MAX_BATCH_SIZE} notes can be created at once",
+            }
+        ), 400
+
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({"success": False, "error": "User not found"}), 404
+
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"success": False, "error": "Invalid note"}), 400
+        raw_title = item.get("title", "")
+        raw_content = item.get("content", "")
+        if not isinstance(raw_title, str) or not isinstance(raw_content, str):
+            return jsonify(
+                {"success": False, "error": "Title and content must be strings"}
+            ), 400
+        error = length_error(raw_title, raw_content)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
+        # Fix: Sanitize user input to prevent XSS
+        title = clean_html(raw_title)
+        content = clean_html(raw_content)
+        if not title or not content:
+            return jsonify(
+                {"success": False, "error": "Title and content are required"}
+            ), 400
+        error = length_error(title, content)
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+
+        rows.append(
+            {
+                "title": title,
+                "content": content,
+                "created_at": datetime.now(),
+                "user_id": current_user.id,
+            }
+        )
+
+    try:
+        db.session.execute(insert(Note), rows)
+        db.session.commit()
+
+        current_app.logger.debug("Created %d notes in one batch", len(rows))
+        return jsonify(
+            {
+                "success": True,
+                "message": f"Created {len(rows)} notes",
+                "count": len(rows),
             }
         )
     except Exception as e:
-        print(f"Error creating note: {e}")
+        current_app.logger.error("Error creating notes: %s", e)
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -126,49 +236,52 @@ def search_notes():
     if "user" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
         return jsonify({"success": False, "error": "User not found"}), 404
 
     query = request.args.get("q", "")
-    print(f"Search query: {query}")
+    current_app.logger.debug("Search query: %s", query)
 
     try:
         # Fix: Use parameterized query and add user_id filter for proper access control
-        sql = text(
-            "SELECT * FROM notes WHERE (title LIKE :query OR content LIKE :query) AND user_id = :user_id"
-        )
+        match = fts_match_expression(query)
+        if match:
+            sql = text(
+                "SELECT notes.id, notes.title, notes.content, notes.created_at, "
+                "notes.user_id FROM notes "
+                "JOIN notes_fts ON notes_fts.rowid = notes.id "
+                "WHERE notes_fts MATCH :match AND notes.user_id = :user_id "
+                "ORDER BY notes_fts.rank LIMIT :limit"
+            )
+        else:
+            sql = text(
+                "SELECT id, title, content, created_at, user_id FROM notes "
+                "WHERE user_id = :user_id LIMIT :limit"
+            )
+        # Typed so SQLite hands back datetimes rather than raw strings
+        sql = sql.columns(created_at=db.DateTime)
         result = db.session.execute(
-            sql, {"query": f"%{query}%", "user_id": current_user.id}
-        )
+            sql,
+            {"match": match, "user_id": current_user.id, "limit": SEARCH_LIMIT},
+        ).mappings()
 
-        notes = []
-        for row in result:
-            # Handle created_at formatting properly - could be a string or datetime
-            created_at = row[3]
-            if isinstance(created_at, str):
-                created_at_str = created_at
-            else:
-                try:
-                    created_at_str = (
-                        created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else None
-                    )
-                except AttributeError:
-                    created_at_str = str(created_at) if created_at else None
-
-            note = {
-                "id": row[0],
-                "title": row[1],
-                "content": row[2],
-                "created_at": created_at_str,
-                "user_id": row[4],
+        notes = [
+            {
+                **row,
+                "created_at": (
+                    row["created_at"].isoformat(sep=" ", timespec="seconds")
+                    if row["created_at"]
+                    else None
+                ),
             }
-            notes.append(note)
+            for row in result
+        ]
 
-        print(f"Found {len(notes)} matching notes")
+        current_app.logger.debug("Found %d matching notes", len(notes))
         return jsonify({"success": True, "notes": notes})
     except Exception as e:
-        print(f"Error searching notes: {e}")
+        current_app.logger.error("Error searching notes: %s", e)
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -179,36 +292,41 @@ def delete_note(note_id):
     if "user" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
+    current_user = get_current_user()
     if not current_user:
         return jsonify({"success": False, "error": "User not found"}), 404
 
     try:
         note = Note.query.get(note_id)
         if not note:
-            print(f"Note not found: {note_id}")
+            current_app.logger.debug("Note not found: %s", note_id)
             return jsonify(
                 {"success": False, "error": f"Note with ID {note_id} not found"}
             ), 404
 
         # Fix: Add proper authorization check
-        if note.user_id != current_user.id and not current_user.is_admin():
-            print(
-                f"Unauthorized deletion attempt of note {note_id} by user {current_user.id}"
+        if note.user_id != current_user.id and not current_user_is_admin():
+            current_app.logger.warning(
+                "Unauthorized deletion attempt of note %s by user %s",
+                note_id,
+                current_user.id,
             )
             return jsonify({"success": False, "error": "Unauthorized"}), 403
 
-        print(
-            f"Deleting note ID: {note_id}, Title: {note.title}, Owner: {note.user_id}"
+        current_app.logger.debug(
+            "Deleting note ID: %s, Title: %s, Owner: %s",
+            note_id,
+            note.title,
+            note.user_id,
         )
 
         db.session.delete(note)
         db.session.commit()
 
-        print(f"Note {note_id} deleted successfully")
+        current_app.logger.debug("Note %s deleted successfully", note_id)
         return jsonify({"success": True})
     except Exception as e:
-        print(f"Error deleting note: {e}")
+        current_app.logger.error("Error deleting note: %s", e)
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -220,27 +338,30 @@ def debug_database():
     if "user" not in session:
         return jsonify({"success": False, "error": "Not logged in"}), 401
 
-    current_user = User.query.filter_by(username=session["user"]).first()
-    if not current_user or not current_user.is_admin():
+    if not current_user_is_admin():
         return jsonify({"success": False, "error": "Unauthorized"}), 403
 
     try:
         users = User.query.all()
-        print("\nAll Users:")
-        for user in users:
-            print(f"ID: {user.id}, Username: {user.username}")
-
         notes = Note.query.all()
-        print("\nAll Notes:")
-        for note in notes:
-            print(f"ID: {note.id}, Title: {note.title}, User ID: {note.user_id}")
 
-        sql = text("SELECT * FROM notes")
-        result = db.session.execute(sql)
-        rows = result.fetchall()
-        print("\nRaw SQL Notes Query Result:")
-        for row in rows:
-            print(row)
+        logger = current_app.logger
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("All Users:")
+            for user in users:
+                logger.debug("ID: %s, Username: %s", user.id, user.username)
+
+            logger.debug("All Notes:")
+            for note in notes:
+                logger.debug(
+                    "ID: %s, Title: %s, User ID: %s", note.id, note.title, note.user_id
+                )
+
+            sql = text("SELECT * FROM notes")
+            rows = db.session.execute(sql).fetchall()
+            logger.debug("Raw SQL Notes Query Result:")
+            for row in rows:
+                logger.debug("%s", row)
 
         return jsonify(
             {
@@ -249,5 +370,5 @@ def debug_database():
             }
         )
     except Exception as e:
-        print(f"Debug Error: {e}")
+        current_app.logger.error("Debug Error: %s", e)
         return jsonify({"error": str(e)}), 500
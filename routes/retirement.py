@@ -4,7 +4,7 @@ from flask import Blueprint, jsonify, render_template, request, session
 
 from extensions import db
 from models.retirement_account import RetirementAccount
-from models.user import User
+from utils.auth import get_current_user
 
 retirement_bp = Blueprint("retirement", __name__, url_prefix="/apps/401k")
 
@@ -21,8 +21,7 @@ def get_balance():
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    username = session["user"]
-    user = User.query.filter_by(username=username).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -51,8 +50,7 @@ def contribute():
     data = request.get_json()
     amount = data.get("amount", 0)
 
-    username = session["user"]
-    user = User.query.filter_by(username=username).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -116,8 +114,7 @@ def reset_account():
     if "user" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    username = session["user"]
-    user = User.query.filter_by(username=username).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -0,0 +1,31 @@
+from flask import g, session
+
+from extensions import db
+from models.user import User
+
+
+def get_current_user():
+    """Return the logged-in user, looked up at most once per request."""
+    user = g.get("_user")
+    if user is None:
+        if "user_id" in session:
+            user = db.session.get(User, session["user_id"])
+            # SQLite hands a deleted user's id to the next signup
+            if user is not None and user.username != session.get("user"):
+                user = None
+        else:
+            user = User.query.filter_by(username=session["user"]).first()
+        g._user = user
+    return user
+
+
+def current_user_is_admin() -> bool:
+    """Check the logged-in user's admin role, at most once per request.
+
+    Always read from the database so a revoked role takes effect immediately.
+    """
+    is_admin = g.get("_is_admin")
+    if is_admin is None:
+        user = get_current_user()
+        is_admin = g._is_admin = bool(user and user.is_admin())
+    return is_admin
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+PAGE_SIZE = 50
+
+
+def get_page_cursor():
+    """Parse the ?cursor= position of the last item on the previous page.
+
+    The cursor is "<ISO 8601 timestamp>_<id>", since several rows can share a
+    timestamp. Returns None when no cursor was given and raises ValueError when
+    it is malformed.
+    """
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return None
+    timestamp, _, item_id = cursor.rpartition("_")
+    return datetime.fromisoformat(timestamp), int(item_id)
+
+
+def paginate(query, timestamp_column, id_column):
+    """Return one keyset page of query, newest first, and the next cursor."""
+    cursor = get_page_cursor()
+    if cursor is not None:
+        cursor_timestamp, cursor_id = cursor
+        query = query.filter(
+            or_(
+                timestamp_column < cursor_timestamp,
+                and_(timestamp_column == cursor_timestamp, id_column < cursor_id),
+            )
+        )
+
+    items = (
+        query.order_by(timestamp_column.desc(), id_column.desc())
+        .limit(PAGE_SIZE + 1)
+        .all()
+    )
+    if len(items) > PAGE_SIZE:
+        items = items[:PAGE_SIZE]
+        last = items[-1]
+        timestamp = getattr(last, timestamp_column.key)
+        next_cursor = f"{timestamp.isoformat()}_{getattr(last, id_column.key)}"
+    else:
+        next_cursor = None
+    return items, next_cursor